@@ -1,19 +1,17 @@
-import requests
+from requests import HTTPError
+from app_v2.clients.mp_http import mp_request
 from app_v2.models import DB, Payment, Merchant
 from sqlalchemy import select
 
-BASE_URL = "https://api.mercadopago.com"
-
-
 def mp_search_payments(access_token: str, limit: int = 10):
     """
     Consulta los últimos pagos desde la API de Mercado Pago.
     """
-    url = f"{BASE_URL}/v1/payments/search?sort=date_created&criteria=desc&limit={limit}"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    resp = requests.get(url, headers=headers, timeout=15)
-    resp.raise_for_status()
-    return resp.json()
+    params = {"sort": "date_created", "criteria": "desc", "limit": limit}
+    status, data = mp_request("GET", "/v1/payments/search", access_token, params=params)
+    if status != 200:
+        raise HTTPError(f"{status} desde MP: {str(data)[:200]}")
+    return data
 
 
 def process_payments(db_session):
@@ -0,0 +1,68 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app_v2.config import Config
+
+BASE_URL = "https://api.mercadopago.com"
+
+# ⏱️ Timeouts separados: conexión (TCP+TLS) y lectura de la respuesta
+TIMEOUT = (Config.MP_CONNECT_TIMEOUT_SECONDS, Config.MP_READ_TIMEOUT_SECONDS)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    """Crea la sesión HTTP compartida con pool de conexiones y keep-alive."""
+    session = requests.Session()
+    # Sesión multi-merchant: no guardamos cookies (no se mezclan entre cuentas)
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    # Sin reintentos: el polling acota cada request al deadline del ciclo y,
+    # si falla por timeout, el merchant pasa al próximo ciclo
+    adapter = HTTPAdapter(
+        pool_connections=1,  # un solo host: api.mercadopago.com
+        pool_maxsize=Config.MP_HTTP_POOL_SIZE,
+        pool_block=False,  # pool lleno: se abre una conexión extra (no se reutiliza) en vez de bloquear
+        max_retries=0,
+    )
+    session.mount("https://", adapter)
+
+    session.headers.update({
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+def get_session():
+    """
+    Devuelve la sesión compartida (se crea una sola vez, thread-safe).
+    El pool de urllib3 es seguro entre hilos; los headers por request
+    (Authorization) se pasan en cada llamada y la sesión no guarda cookies.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def mp_request(method: str, path: str, access_token: str, **kwargs):
+    """
+    Ejecuta un request contra la API de Mercado Pago usando el pool compartido.
+    Devuelve (status_code, data): data es el JSON si status 200, o el texto del error.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    headers.update(kwargs.pop("headers", {}))
+    kwargs.setdefault("timeout", TIMEOUT)
+
+    resp = get_session().request(method, f"{BASE_URL}{path}", headers=headers, **kwargs)
+    if resp.status_code != 200:
+        return resp.status_code, resp.text
+    return resp.status_code, resp.json()
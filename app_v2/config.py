@@ -18,6 +18,26 @@ class Config:
     # =====================================================
     POLLING_INTERVAL_SECONDS = int(os.environ.get("POLLING_INTERVAL_SECONDS", 30))
 
+    # =====================================================
+    # Cliente HTTP de Mercado Pago (pool + timeouts)
+    # =====================================================
+    MP_HTTP_POOL_SIZE = int(os.environ.get("MP_HTTP_POOL_SIZE", 10))
+    MP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("MP_CONNECT_TIMEOUT_SECONDS", 5))
+    MP_READ_TIMEOUT_SECONDS = float(os.environ.get("MP_READ_TIMEOUT_SECONDS", 20))
+
+    # =====================================================
+    # Profiling (apagado por defecto, se activa por env o /admin/profiling)
+    # =====================================================
+    PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+    PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0.1))
+    PROFILING_SLOW_MS = float(os.environ.get("PROFILING_SLOW_MS", 1000))
+    PROFILING_MAX_ENTRIES = int(os.environ.get("PROFILING_MAX_ENTRIES", 100))
+
+    # =====================================================
+    # API Key para endpoints admin (sin key, quedan deshabilitados)
+    # =====================================================
+    ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")
+
     # =====================================================
     # Configuración de entorno
     # =====================================================
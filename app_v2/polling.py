@@ -1,102 +1,273 @@
+import threading
+import time
+from collections import deque
 import requests
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
 from datetime import datetime, timedelta
 from app_v2.models import DB, Merchant, Payment
 from app_v2.security import decrypt_token
+from app_v2.clients.mp_http import mp_request, TIMEOUT
+from app_v2.profiling import profile_job
 
 # 🔁 Intervalo de consulta
 POLL_INTERVAL_SECONDS = 15
 
+# ⏳ Tiempo máximo por ciclo (siempre menor al intervalo, para que no se pisen):
+# los merchants que no entran pasan al próximo ciclo
+POLL_CYCLE_DEADLINE_SECONDS = POLL_INTERVAL_SECONDS * 0.8
+
+# Si queda menos que esto para el deadline, el merchant pasa al próximo ciclo
+MIN_MERCHANT_SECONDS = 5
+
+assert MIN_MERCHANT_SECONDS < POLL_CYCLE_DEADLINE_SECONDS < POLL_INTERVAL_SECONDS
+
 # 🧾 Nuevo endpoint de Mercado Pago que lista todas las actividades (pagos + transferencias)
-MP_API_URL = "https://api.mercadopago.com/v1/account/activities/search"
+MP_ACTIVITIES_PATH = "/v1/account/activities/search"
 
 scheduler = BackgroundScheduler()
 
+# Merchants que quedaron sin procesar en el ciclo anterior (van primero en el siguiente)
+_carry_over = deque()
+_cycle_lock = threading.Lock()
+_stats_lock = threading.Lock()  # el listener del scheduler y el job escriben en paralelo
+
+# 📊 Estado visible en /health
+polling_stats = {
+    "last_cycle_at": None,
+    "last_cycle_seconds": None,
+    "last_processed": 0,
+    "last_carried_over": 0,
+    "last_lag_seconds": None,
+    "max_lag_seconds": 0.0,
+    "missed_runs": 0,
+    "skipped_overlaps": 0,
+}
+
+
+def _cycle_order(merchant_ids):
+    """Orden del ciclo: primero los pendientes del ciclo anterior, después el resto."""
+    current = set(merchant_ids)
+    pending = [mid for mid in _carry_over if mid in current]
+    pending_set = set(pending)
+    return pending + [mid for mid in merchant_ids if mid not in pending_set]
+
+
+def _bump_stat(key):
+    with _stats_lock:
+        polling_stats[key] += 1
+
+
+def _request_timeout(remaining):
+    """
+    Timeouts (connect, read) configurados, acotados al tiempo que queda del ciclo.
+    El cliente no reintenta, así que connect + read entran en `remaining`.
+    """
+    connect_timeout, read_timeout = TIMEOUT
+    remaining = max(remaining, 0.2)  # requests rechaza timeouts negativos
+    connect_timeout = min(connect_timeout, remaining / 2)
+    return (connect_timeout, min(read_timeout, remaining - connect_timeout))
+
+
+def _fetch_activities(access_token, timeout):
+    """Consulta las últimas 3 horas de movimientos (sin tocar la base)."""
+    now = datetime.utcnow()
+    date_from = (now - timedelta(hours=3)).isoformat() + "Z"
+
+    payload = {
+        "range": {"date_created": {"from": date_from}},
+        "filters": {"event_types": ["transfer", "payment"]},
+        "limit": 10,
+        "sort": {"field": "date_created", "order": "desc"},
+    }
+
+    # ✅ POST (no GET) por el pool compartido (keep-alive + gzip)
+    return mp_request("POST", MP_ACTIVITIES_PATH, access_token, json=payload, timeout=timeout)
+
+
+def _poll_merchant(merchant_id, deadline):
+    """
+    Procesa un merchant con su propia sesión corta: la conexión se libera al terminar.
+    Devuelve False si se cortó por timeout (queda pendiente para el próximo ciclo).
+    """
+    with DB.session() as session:
+        m = session.get(Merchant, merchant_id)
+        if not m:
+            return True
+        name = m.name
+        access_token = decrypt_token(m.mp_access_token_enc)
+        # Cerramos la transacción antes del request HTTP para no retener la conexión
+        session.rollback()
+
+    try:
+        _save_activities(merchant_id, name, access_token, deadline)
+    except requests.Timeout:
+        print(f"⏳ Timeout consultando a MP para {name}, pasa al próximo ciclo")
+        return False
+    except Exception as sub_e:
+        print(f"❌ Error procesando merchant {name}: {sub_e}")
+    return True
+
+
+def _save_activities(merchant_id, name, access_token, deadline):
+    if not access_token:
+        print(f"⚠️ Token vacío o inválido para {name}")
+        return
+
+    timeout = _request_timeout(deadline - time.monotonic())
+    status, data = _fetch_activities(access_token, timeout)
+    if status != 200:
+        print(f"⚠️ Error {status} desde MP: {data[:200]}")
+        return
+
+    results = data.get("results", [])
+    print(f"📥 {len(results)} actividades recibidas para {name}")
+
+    candidates = {}
+    for item in results:
+        # Determinar si es pago o transferencia
+        event_type = item.get("event_type", "")
+        tx = item.get("transaction", {})
+
+        if not tx:
+            continue
+
+        pid = str(tx.get("id") or tx.get("external_id") or f"tx_{datetime.utcnow().timestamp()}")
+        candidates[pid] = (event_type, tx)
+
+    if not candidates:
+        return
+
+    with DB.session() as session:
+        try:
+            # Una sola consulta de ids (sin cargar objetos Payment al identity map)
+            existing = set(
+                session.execute(
+                    DB.select(Payment.id).where(Payment.id.in_(list(candidates)))
+                ).scalars()
+            )
+
+            saved = []
+            for pid, (event_type, tx) in candidates.items():
+                if pid in existing:
+                    continue
+
+                amount = float(tx.get("amount", 0.0))
+                payer_name = (
+                    tx.get("counterparty_name")
+                    or tx.get("description")
+                    or "Desconocido"
+                )
+
+                session.add(Payment(
+                    id=pid,
+                    merchant_id=merchant_id,
+                    payer_name=payer_name,
+                    amount=amount,
+                    status="approved",
+                    date_created=datetime.utcnow(),
+                    created_at=datetime.utcnow(),
+                ))
+                saved.append((event_type, amount, payer_name))
+
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    for event_type, amount, payer_name in saved:
+        print(f"💾 Guardado {event_type}: ${amount} de {payer_name}")
+
+
+@profile_job("run_polling_job")
 def run_polling_job(app):
     """Consulta todas las actividades recientes de cada merchant (pagos o transferencias)."""
+    if not _cycle_lock.acquire(blocking=False):
+        _bump_stat("skipped_overlaps")
+        print("⏭️ Ciclo de polling anterior todavía en curso, se omite este.")
+        return
+
     print("🔄 Ejecutando job de polling...")
+    started = time.monotonic()
+    deadline = started + POLL_CYCLE_DEADLINE_SECONDS
+    processed = 0
     try:
         with app.app_context():
+            # Sólo ids: la sesión se cierra enseguida
             with DB.session() as session:
-                merchants = session.query(Merchant).all()
-                for m in merchants:
-                    try:
-                        access_token = decrypt_token(m.mp_access_token_enc)
-                        if not access_token:
-                            print(f"⚠️ Token vacío o inválido para {m.name}")
-                            continue
-
-                        # Buscamos las últimas 3 horas de movimientos
-                        now = datetime.utcnow()
-                        date_from = (now - timedelta(hours=3)).isoformat() + "Z"
-
-                        payload = {
-                            "range": {"date_created": {"from": date_from}},
-                            "filters": {"event_types": ["transfer", "payment"]},
-                            "limit": 10,
-                            "sort": {"field": "date_created", "order": "desc"},
-                        }
-
-                        headers = {
-                            "Authorization": f"Bearer {access_token}",
-                            "Content-Type": "application/json",
-                        }
-
-                        # ✅ POST (no GET)
-                        r = requests.post(MP_API_URL, headers=headers, json=payload, timeout=20)
-
-                        if r.status_code != 200:
-                            print(f"⚠️ Error {r.status_code} desde MP: {r.text[:200]}")
-                            continue
-
-                        data = r.json()
-                        results = data.get("results", [])
-                        print(f"📥 {len(results)} actividades recibidas para {m.name}")
-
-                        for item in results:
-                            # Determinar si es pago o transferencia
-                            event_type = item.get("event_type", "")
-                            tx = item.get("transaction", {})
-
-                            if not tx:
-                                continue
-
-                            pid = str(tx.get("id") or tx.get("external_id") or f"tx_{datetime.utcnow().timestamp()}")
-                            if session.query(Payment).filter_by(id=pid).first():
-                                continue
-
-                            amount = float(tx.get("amount", 0.0))
-                            payer_name = (
-                                tx.get("counterparty_name")
-                                or tx.get("description")
-                                or "Desconocido"
-                            )
-
-                            new_p = Payment(
-                                id=pid,
-                                merchant_id=m.id,
-                                payer_name=payer_name,
-                                amount=amount,
-                                status="approved",
-                                date_created=datetime.utcnow(),
-                                created_at=datetime.utcnow(),
-                            )
-                            session.add(new_p)
-                            session.commit()
-                            print(f"💾 Guardado {event_type}: ${amount} de {payer_name}")
-
-                    except Exception as sub_e:
-                        session.rollback()
-                        print(f"❌ Error procesando merchant {m.name}: {sub_e}")
+                merchant_ids = session.execute(
+                    DB.select(Merchant.id).order_by(Merchant.created_at)
+                ).scalars().all()
+
+            order = _cycle_order(merchant_ids)
+            deferred = []  # cortados por timeout: van primero en el próximo ciclo
+            left_over = []
+            for i, merchant_id in enumerate(order):
+                if deadline - time.monotonic() < MIN_MERCHANT_SECONDS:
+                    left_over = order[i:]
+                    print(f"⏳ Deadline alcanzado: {len(left_over)} merchants pasan al próximo ciclo")
+                    break
+                try:
+                    done = _poll_merchant(merchant_id, deadline)
+                except Exception as sub_e:
+                    # Sólo falla acá si no se pudo cargar el merchant (sin nombre todavía)
+                    print(f"❌ Error cargando merchant {merchant_id}: {sub_e}")
+                    done = True
+                if done:
+                    processed += 1
+                else:
+                    deferred.append(merchant_id)
+
+            _carry_over.clear()
+            _carry_over.extend(deferred + left_over)
 
     except Exception as e:
         print(f"❌ Error general durante el polling: {e}")
+    finally:
+        with _stats_lock:
+            polling_stats["last_cycle_at"] = datetime.utcnow().isoformat()
+            polling_stats["last_cycle_seconds"] = round(time.monotonic() - started, 2)
+            polling_stats["last_processed"] = processed
+            polling_stats["last_carried_over"] = len(_carry_over)
+        _cycle_lock.release()
+
+
+def _on_scheduler_event(event):
+    """Registra el retraso del scheduler y las ejecuciones perdidas/omitidas."""
+    if event.code == EVENT_JOB_SUBMITTED:
+        scheduled = event.scheduled_run_times[0]
+        lag = (datetime.now(scheduled.tzinfo) - scheduled).total_seconds()
+        with _stats_lock:
+            polling_stats["last_lag_seconds"] = round(lag, 3)
+            polling_stats["max_lag_seconds"] = max(polling_stats["max_lag_seconds"], round(lag, 3))
+        if lag > 1:
+            print(f"🐢 Scheduler con {lag:.1f}s de retraso")
+    elif event.code == EVENT_JOB_MAX_INSTANCES:
+        _bump_stat("skipped_overlaps")
+        print("⏭️ Polling omitido: la ejecución anterior sigue en curso")
+    elif event.code == EVENT_JOB_MISSED:
+        _bump_stat("missed_runs")
+        print("⚠️ Polling perdido (misfire)")
 
 
 def start_scheduler(app):
     """Inicia el scheduler con el contexto Flask activo"""
     try:
-        scheduler.add_job(run_polling_job, "interval", seconds=POLL_INTERVAL_SECONDS, args=[app])
+        scheduler.add_listener(
+            _on_scheduler_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+        )
+        # Nunca dos ciclos a la vez; si se atrasa, se junta en una sola ejecución
+        scheduler.add_job(
+            run_polling_job,
+            "interval",
+            seconds=POLL_INTERVAL_SECONDS,
+            args=[app],
+            id="polling",
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=POLL_INTERVAL_SECONDS,
+            replace_existing=True,
+        )
         scheduler.start()
         print(f"[Scheduler] Iniciado cada {POLL_INTERVAL_SECONDS} segundos.")
         print("⏱️ Scheduler activo con contexto Flask.")
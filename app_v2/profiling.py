@@ -0,0 +1,280 @@
+import cProfile
+import functools
+import io
+import math
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app_v2.config import Config
+
+# =====================================================
+# Profiler opcional para requests y jobs
+# Apagado: cada hook sólo lee un booleano y retorna.
+# =====================================================
+
+MAX_SQL_PER_ENTRY = 50
+MAX_SQL_CHARS = 500
+PROFILE_TOP_N = 30
+MAX_STACK_SAMPLES = 5
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class _ProfilerState:
+    def __init__(self):
+        self.enabled = Config.PROFILING_ENABLED
+        self.sample_rate = Config.PROFILING_SAMPLE_RATE
+        self.slow_ms = Config.PROFILING_SLOW_MS
+        self.entries = deque(maxlen=Config.PROFILING_MAX_ENTRIES)
+        self.stats = {}  # clave (ruta o job) -> {count, total_ms, max_ms}
+        self.in_flight = {}  # id(medición) -> medición, revisadas por el watchdog
+        self.lock = threading.Lock()
+        self.sql_listener_installed = False
+        self.watchdog_started = False
+
+
+_state = _ProfilerState()
+_local = threading.local()
+
+
+# =====================================================
+# Captura de SQL (por hilo, sólo mientras hay una medición activa)
+# =====================================================
+
+def _on_sql(conn, cursor, statement, parameters, context, executemany):
+    statements = getattr(_local, "sql", None)
+    if statements is not None and len(statements) < MAX_SQL_PER_ENTRY:
+        statements.append(statement[:MAX_SQL_CHARS])
+
+
+def _install_sql_listener():
+    with _state.lock:
+        if not _state.sql_listener_installed:
+            event.listen(Engine, "before_cursor_execute", _on_sql)
+            _state.sql_listener_installed = True
+
+
+# =====================================================
+# Watchdog: toma stacks de las mediciones que pasan el umbral
+# (así toda captura lenta tiene un resumen, aunque no haya caído en el sampleo de cProfile)
+# =====================================================
+
+def _watchdog_loop():
+    while True:
+        time.sleep(min(max(_state.slow_ms / 2000, 0.1), 1.0))
+        if not _state.enabled:
+            continue
+
+        now = time.perf_counter()
+        # Todo bajo el lock: finish() saca la medición de in_flight con el mismo lock,
+        # así nunca se agrega un stack de otro request a una captura ya guardada
+        with _state.lock:
+            slow = [
+                m for m in _state.in_flight.values()
+                if (now - m.start) * 1000 >= _state.slow_ms and len(m.stacks) < MAX_STACK_SAMPLES
+            ]
+            if not slow:
+                continue
+
+            frames = sys._current_frames()
+            for m in slow:
+                frame = frames.get(m.thread_id)
+                if frame is not None:
+                    m.stacks.append({
+                        "at_ms": round((now - m.start) * 1000, 2),
+                        "stack": "".join(traceback.format_stack(frame)),
+                    })
+
+
+def _start_watchdog():
+    with _state.lock:
+        if not _state.watchdog_started:
+            threading.Thread(target=_watchdog_loop, name="profiling-watchdog", daemon=True).start()
+            _state.watchdog_started = True
+
+
+# =====================================================
+# Medición
+# =====================================================
+
+class _Measurement:
+    """Una medición en curso (request o job) en el hilo actual."""
+
+    def __init__(self, kind, key):
+        self.kind = kind
+        self.key = key
+        self.profiler = None
+        self.thread_id = threading.get_ident()
+        self.stacks = []
+        self.start = time.perf_counter()
+        self._outer_sql = getattr(_local, "sql", None)  # medición anidada (ej: /poll -> job)
+        _local.sql = []
+
+        # Medición anidada en el mismo hilo: no se arranca otro cProfile, porque
+        # reemplazaría al de afuera y su disable() lo cortaría
+        if self._outer_sql is None and random.random() < _state.sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self.profiler = profiler
+            except ValueError:
+                # Python 3.12+: otro hilo ya tiene un profiler activo, sólo tomamos tiempos
+                pass
+
+        with _state.lock:
+            _state.in_flight[id(self)] = self
+
+    def finish(self, error=None):
+        if self.profiler is not None:
+            self.profiler.disable()
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        statements = _local.sql or []
+        _local.sql = self._outer_sql
+
+        with _state.lock:
+            _state.in_flight.pop(id(self), None)
+            s = _state.stats.setdefault(self.key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            s["count"] += 1
+            s["total_ms"] += elapsed_ms
+            s["max_ms"] = max(s["max_ms"], elapsed_ms)
+
+        if elapsed_ms < _state.slow_ms:
+            return
+
+        entry = {
+            "kind": self.kind,
+            "key": self.key,
+            "duration_ms": round(elapsed_ms, 2),
+            "time": datetime.utcnow().isoformat(),
+            "error": str(error) if error else None,
+            "sql": statements,
+            "profile": _profile_summary(self.profiler) if self.profiler else None,
+            "stacks": self.stacks,
+        }
+        with _state.lock:
+            _state.entries.append(entry)
+        print(f"🐢 {self.kind} lento: {self.key} ({elapsed_ms:.0f} ms, {len(statements)} SQL)")
+
+
+def _profile_summary(profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    return out.getvalue()
+
+
+# =====================================================
+# Hooks Flask y decorador para jobs
+# =====================================================
+
+def init_profiling(app):
+    """Registra los hooks de profiling para todas las rutas (todos los blueprints)."""
+
+    @app.before_request
+    def _profiling_start():
+        if not _state.enabled:
+            return
+        # Rutas inexistentes (404, scanners) comparten una sola clave: stats acotado
+        key = f"{request.method} {request.url_rule.rule}" if request.url_rule else UNMATCHED_ROUTE
+        g._profiling = _Measurement("request", key)
+
+    @app.teardown_request
+    def _profiling_finish(exc):
+        m = g.pop("_profiling", None)
+        if m is not None:
+            m.finish(exc)
+
+    if _state.enabled:
+        _install_sql_listener()
+        _start_watchdog()
+
+
+def profile_job(name):
+    """Decorador para jobs del scheduler (ej: run_polling_job)."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return fn(*args, **kwargs)
+            m = _Measurement("job", name)
+            error = None
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                m.finish(error)
+
+        return wrapper
+
+    return decorator
+
+
+# =====================================================
+# Control en runtime (usado por las rutas admin)
+# =====================================================
+
+def _finite(value):
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("valor no finito")
+    return value
+
+
+def configure(enabled=None, sample_rate=None, slow_ms=None):
+    """Valida todos los valores antes de aplicar (ValueError/TypeError si alguno es inválido)."""
+    if sample_rate is not None:
+        sample_rate = min(max(_finite(sample_rate), 0.0), 1.0)
+    if slow_ms is not None:
+        slow_ms = max(_finite(slow_ms), 0.0)
+
+    if sample_rate is not None:
+        _state.sample_rate = sample_rate
+    if slow_ms is not None:
+        _state.slow_ms = slow_ms
+    if enabled is not None:
+        if enabled:
+            _install_sql_listener()
+            _start_watchdog()
+        _state.enabled = bool(enabled)
+    return get_status()
+
+
+def get_status():
+    with _state.lock:
+        return {
+            "enabled": _state.enabled,
+            "sample_rate": _state.sample_rate,
+            "slow_ms": _state.slow_ms,
+            "entries": len(_state.entries),
+            "max_entries": _state.entries.maxlen,
+            "stats": {
+                k: {
+                    "count": s["count"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 2),
+                    "max_ms": round(s["max_ms"], 2),
+                }
+                for k, s in _state.stats.items()
+            },
+        }
+
+
+def get_entries():
+    with _state.lock:
+        return list(_state.entries)
+
+
+def clear():
+    with _state.lock:
+        _state.entries.clear()
+        _state.stats.clear()
@@ -0,0 +1,61 @@
+import hmac
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from app_v2 import profiling
+
+profiling_bp = Blueprint("profiling", __name__)
+
+
+@profiling_bp.before_request
+def require_admin_key():
+    expected = current_app.config.get("ADMIN_API_KEY")
+    provided = request.headers.get("X-Admin-Key", "")
+    if not expected or not hmac.compare_digest(provided.encode(), expected.encode()):
+        return jsonify({"error": "No autorizado"}), 403
+
+
+@profiling_bp.get("/admin/profiling")
+def profiling_status():
+    """Estado del profiler y estadísticas por ruta/job"""
+    return jsonify(profiling.get_status()), 200
+
+
+@profiling_bp.post("/admin/profiling")
+def profiling_configure():
+    """Activa/desactiva el profiler en runtime. Body: {enabled, sample_rate, slow_ms}"""
+    data = request.get_json(force=True, silent=True) or {}
+    if data.get("enabled") is not None and not isinstance(data["enabled"], bool):
+        return jsonify({"error": "enabled debe ser true o false"}), 400
+
+    try:
+        status = profiling.configure(
+            enabled=data.get("enabled"),
+            sample_rate=data.get("sample_rate"),
+            slow_ms=data.get("slow_ms"),
+        )
+    except (TypeError, ValueError):
+        return jsonify({"error": "sample_rate y slow_ms deben ser numéricos y finitos"}), 400
+    print(f"[Profiling] Configuración actualizada: enabled={status['enabled']}")
+    return jsonify(status), 200
+
+
+@profiling_bp.get("/admin/profiling/entries")
+def profiling_entries():
+    """Descarga las capturas de requests/jobs lentos (JSON)"""
+    body = json.dumps({"status": profiling.get_status(), "entries": profiling.get_entries()}, indent=2)
+    filename = f"profiling_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    return Response(
+        body,
+        mimetype="application/json",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@profiling_bp.delete("/admin/profiling/entries")
+def profiling_clear():
+    """Limpia capturas y estadísticas"""
+    profiling.clear()
+    return jsonify({"ok": True}), 200
@@ -2,7 +2,8 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from datetime import datetime
 from app_v2.models import DB
-from app_v2.polling import start_scheduler
+from app_v2.polling import start_scheduler, polling_stats
+from app_v2.profiling import init_profiling
 
 
 def create_app():
@@ -16,6 +17,9 @@ def create_app():
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True}
     DB.init_app(app)
 
+    # ✅ Hooks de profiling (no hacen nada mientras esté apagado)
+    init_profiling(app)
+
     with app.app_context():
         DB.create_all()
         print("📦 Tablas creadas o verificadas correctamente.")
@@ -25,12 +29,14 @@ def create_app():
         from app_v2.routes.devices import devices_bp
         from app_v2.routes.pagos import pagos_bp
         from app_v2.routes_notify import bp_notify  # 🟢 Nuevo blueprint
+        from app_v2.routes.profiling import profiling_bp
 
         app.register_blueprint(devices_bp)
         app.register_blueprint(pagos_bp)
         app.register_blueprint(bp_notify)  # 🟢 Registrar /notify
+        app.register_blueprint(profiling_bp)
 
-        print("🧩 Blueprints registrados correctamente: devices, pagos, notify")
+        print("🧩 Blueprints registrados correctamente: devices, pagos, notify, profiling")
 
     except Exception as e:
         print(f"⚠️ Error registrando blueprints: {e}")
@@ -58,6 +64,7 @@ def create_app():
         return jsonify({
             "status": "ok",
             "db_connected": DB.session.bind is not None,
+            "polling": polling_stats,
             "time": datetime.utcnow().isoformat()
         })
 